@@ -2,18 +2,25 @@
 # IMPORTANT: Always run in app_nasz_gpt environment!
 
 import os
-import json
+import atexit
+import tempfile
+import itertools
+import threading
+import orjson
 import io
 from pathlib import Path
-from typing import Dict, List, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
 import streamlit as st
 from openai import OpenAI as OpenAINative  # walidacja klucza bez Langfuse
 from langfuse.openai import OpenAI  # Langfuse OpenAI wrapper dla automatycznego śledzenia
+from langfuse.openai import modifier as langfuse_modifier  # klient Langfuse tworzony przy pierwszym zapytaniu
 from dotenv import load_dotenv, dotenv_values
-import PyPDF2
+import pypdfium2 as pdfium
 import docx
+import tiktoken
 import time
-import requests
+import httpx
 
 # ==============================================================================
 # CONFIGURATION & CONSTANTS
@@ -50,8 +57,22 @@ Jesteś pomocnym asystentem AI, który odpowiada na pytania użytkownika w spos
 Jeśli otrzymasz dokument do analizy, przeanalizuj go dokładnie i odpowiedz na pytania na jego podstawie.
 """.strip()
 
+APP_CSS_PATH = Path(__file__).parent / "assets" / "app.css"  # niezależnie od katalogu uruchomienia
+
 DB_PATH = Path("db")
 DB_CONVERSATIONS_PATH = DB_PATH / "conversations"
+DB_INDEX_PATH = DB_PATH / "index.json"  # {id: {id, name, message_count}} — lista konwersacji bez czytania transkryptów
+
+# Maksymalna długość treści załącznika dołączanej do promptu systemowego (w znakach).
+# Dokument trafia do każdego zapytania, więc jego długość wprost przekłada się na koszt i czas odpowiedzi.
+MAX_FILE_CONTENT_CHARS = 20_000
+
+# Budżet tokenów historii rozmowy dołączanej do zapytania (bez promptu systemowego).
+# Najstarsze wiadomości są pomijane, gdy historia go przekracza — długość promptu wprost przekłada się na koszt i czas.
+MEMORY_TOKEN_BUDGET = 16_000
+
+# Liczba ostatnich wiadomości renderowanych w czacie; starsze pokazywane są dopiero na żądanie
+VISIBLE_MESSAGES = 50
 
 # ==============================================================================
 # UTILITY FUNCTIONS
@@ -219,70 +240,164 @@ def render_startup_configuration(env: dict) -> None:
     st.stop()
 
 
-def extract_text_from_pdf(pdf_file) -> str:
-    """Wyodrębnia tekst z pliku PDF"""
-    try:
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-        return text
-    except Exception as e:
-        st.error(f"❌ Błąd odczytu pliku PDF: {str(e)}")
-        return ""
+@st.cache_resource
+def get_pdfium_lock() -> threading.Lock:
+    """Blokada dla PDFium — biblioteka nie jest bezpieczna wątkowo, a załączniki są parsowane w wątkach w tle"""
+    return threading.Lock()
 
-def extract_text_from_docx(docx_file) -> str:
-    """Wyodrębnia tekst z pliku DOCX"""
-    try:
-        doc = docx.Document(docx_file)
-        text = ""
-        for paragraph in doc.paragraphs:
-            text += paragraph.text + "\n"
-        return text
-    except Exception as e:
-        st.error(f"❌ Błąd odczytu pliku DOCX: {str(e)}")
-        return ""
+@st.cache_data(show_spinner=False, max_entries=16)
+def extract_text_from_pdf(file_bytes: bytes, _on_progress: Optional[Callable[[int, int], None]] = None) -> str:
+    """Wyodrębnia tekst z pliku PDF przez PDFium (cache po zawartości pliku — parsowanie raz na upload).
+    Puste strony (np. skany bez warstwy tekstowej) są pomijane. _on_progress(gotowe_strony, wszystkie_strony)
+    wywoływane jest po każdej stronie (parametr z "_" nie wchodzi do klucza cache).
+    """
+    parts = []
+    with get_pdfium_lock():
+        pdf = pdfium.PdfDocument(file_bytes)
+        try:
+            page_count = len(pdf)
+            for i in range(page_count):
+                page = pdf[i]
+                try:
+                    textpage = page.get_textpage()
+                    try:
+                        # PDFium kończy wiersze "\r\n" — ujednolicamy do "\n" jak przy łączeniu stron
+                        text = textpage.get_text_bounded().replace("\r\n", "\n")
+                    finally:
+                        textpage.close()
+                finally:
+                    page.close()
+                if text.strip():
+                    parts.append(text)
+                if _on_progress:
+                    _on_progress(i + 1, page_count)
+        finally:
+            pdf.close()
+    return "\n".join(parts)
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def extract_text_from_docx(file_bytes: bytes, _on_progress: Optional[Callable[[int, int], None]] = None) -> str:
+    """Wyodrębnia tekst z pliku DOCX (cache po zawartości pliku; bez raportowania postępu)"""
+    doc = docx.Document(io.BytesIO(file_bytes))
+    return "\n".join(paragraph.text for paragraph in doc.paragraphs)
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def extract_text_from_txt(file_bytes: bytes, _on_progress: Optional[Callable[[int, int], None]] = None) -> str:
+    """Wyodrębnia tekst z pliku TXT (cache po zawartości pliku; bez raportowania postępu)"""
+    return file_bytes.decode("utf-8")
+
+# Obsługiwane formaty załączników: rozszerzenie -> funkcja wyodrębniająca tekst z bajtów pliku
+# (wspólna sygnatura: extractor(file_bytes, _on_progress=None) -> str)
+FILE_EXTRACTORS = {
+    "pdf": extract_text_from_pdf,
+    "docx": extract_text_from_docx,
+    "txt": extract_text_from_txt,
+}
 
-def extract_text_from_txt(txt_file) -> str:
-    """Wyodrębnia tekst z pliku TXT"""
-    try:
-        return txt_file.read().decode("utf-8")
-    except Exception as e:
-        st.error(f"❌ Błąd odczytu pliku TXT: {str(e)}")
-        return ""
+@st.cache_resource
+def get_file_processing_pool() -> ThreadPoolExecutor:
+    """Pula wątków do przetwarzania załączników w tle (wspólna dla wszystkich sesji)"""
+    return ThreadPoolExecutor(max_workers=2)
 
-def process_uploaded_file(uploaded_file) -> Optional[str]:
-    """Przetwarza przesłany plik i zwraca jego treść"""
+def parse_document(file_extension: str, file_bytes: bytes, on_progress: Callable[[int, int], None]) -> str:
+    """Wyodrębnia tekst z pliku. Uruchamiane w wątku w tle — bez wywołań st.*, błędy zgłaszane są wyjątkiem."""
+    return FILE_EXTRACTORS[file_extension](file_bytes, _on_progress=on_progress)
+
+def process_uploaded_file(uploaded_file):
+    """Uruchamia w tle przetwarzanie przesłanego pliku (raz na upload); wynik odbiera collect_file_processing_result"""
     if not uploaded_file:
-        return None
-    
+        return
+
+    job = st.session_state.get("file_job")
+    if job and job["file_id"] == uploaded_file.file_id:
+        return
+
     file_extension = uploaded_file.name.split(".")[-1].lower()
-    
-    with st.spinner(f"📄 Przetwarzanie pliku {uploaded_file.name}..."):
-        if file_extension == "pdf":
-            return extract_text_from_pdf(uploaded_file)
-        elif file_extension == "docx":
-            return extract_text_from_docx(uploaded_file)
-        elif file_extension == "txt":
-            return extract_text_from_txt(uploaded_file)
-        else:
-            st.error(f"❌ Nieobsługiwany format pliku: {file_extension}")
-            return None
+    if file_extension not in FILE_EXTRACTORS:
+        st.error(f"❌ Nieobsługiwany format pliku: {file_extension}")
+        return
+
+    # Postęp aktualizowany przez wątek w tle, odczytywany przez fragment z podglądem stanu
+    progress = {"done": 0, "total": 0}
+    future = get_file_processing_pool().submit(
+        parse_document,
+        file_extension,
+        uploaded_file.getvalue(),
+        lambda done, total: progress.update(done=done, total=total),
+    )
+    st.session_state.file_job = {
+        "file_id": uploaded_file.file_id,
+        "name": uploaded_file.name,
+        "extension": file_extension,
+        "future": future,
+        "progress": progress,
+        "collected": False,
+        "error": None,
+    }
+
+def collect_file_processing_result(wait: bool = False):
+    """Zapisuje wynik przetwarzania w session_state, gdy wątek w tle skończył (przy wait=True czeka na niego)"""
+    job = st.session_state.get("file_job")
+    if not job or job["collected"]:
+        return
+    if not wait and not job["future"].done():
+        return
+
+    try:
+        file_content = job["future"].result()
+    except Exception as e:
+        job["error"] = str(e)
+    else:
+        if file_content:
+            st.session_state.uploaded_file_content = file_content
+    job["collected"] = True
+
+def get_conversation_usage_totals(messages: List[Dict]) -> Dict:
+    """Zwraca sumy tokenów i czasu odpowiedzi dla konwersacji.
+    Sumy są trzymane w session_state i przy kolejnym przebiegu doliczane są tylko nowe wiadomości.
+    """
+    conversation_id = st.session_state.get("conversation_id")
+    totals = st.session_state.get("usage_totals")
+    if (
+        not totals
+        or totals["conversation_id"] != conversation_id
+        or totals["message_count"] > len(messages)
+    ):
+        # Inna konwersacja (lub historia się skróciła) — liczymy od zera
+        totals = {
+            "conversation_id": conversation_id,
+            "message_count": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "total_tokens": 0,
+            "response_time": 0.0,
+        }
+
+    for message in messages[totals["message_count"]:]:
+        usage = message.get("usage") or {}
+        totals["prompt_tokens"] += usage.get("prompt_tokens", 0)
+        totals["completion_tokens"] += usage.get("completion_tokens", 0)
+        totals["total_tokens"] += usage.get("total_tokens", 0)
+        totals["response_time"] += usage.get("response_time", 0)
+    totals["message_count"] = len(messages)
+
+    st.session_state.usage_totals = totals
+    return totals
 
 def calculate_conversation_cost(messages: List[Dict], pricing: Dict) -> tuple[float, float]:
     """Oblicza koszt całej konwersacji oraz sumaryczny czas odpowiedzi (w sekundach)"""
-    total_cost = 0.0
-    total_time = 0.0
-    for message in messages:
-        if "usage" in message:
-            usage = message["usage"]
-            total_cost += (
-                usage.get("prompt_tokens", 0) * pricing["input_tokens"] +
-                usage.get("completion_tokens", 0) * pricing["output_tokens"]
-            )
-            total_time += usage.get("response_time", 0)
+    totals = get_conversation_usage_totals(messages)
+    total_cost = (
+        totals["prompt_tokens"] * pricing["input_tokens"] +
+        totals["completion_tokens"] * pricing["output_tokens"]
+    )
     # Zwracamy koszt oraz sumaryczny czas odpowiedzi
-    return total_cost, total_time
+    return total_cost, totals["response_time"]
+
+@st.cache_resource
+def get_http_client() -> httpx.Client:
+    """Współdzielony klient HTTP (keep-alive) dla zewnętrznych API — bez nowego połączenia TCP/TLS przy każdym żądaniu"""
+    return httpx.Client(timeout=5)
 
 @st.cache_data(show_spinner=False, ttl=3600)
 def get_usd_to_pln_rate() -> tuple[float, Optional[str]]:
@@ -291,7 +406,7 @@ def get_usd_to_pln_rate() -> tuple[float, Optional[str]]:
     """
     try:
         url = "https://api.nbp.pl/api/exchangerates/rates/A/USD/?format=json"
-        response = requests.get(url, timeout=5)
+        response = get_http_client().get(url)
         if response.status_code != 200:
             raise RuntimeError(f"NBP HTTP {response.status_code}")
         data = response.json()
@@ -309,24 +424,102 @@ def get_usd_to_pln_rate() -> tuple[float, Optional[str]]:
 # CHATBOT FUNCTIONS
 # ==============================================================================
 
+def flush_langfuse_on_exit() -> None:
+    """Opróżnia kolejkę Langfuse przy zamykaniu aplikacji (o ile klient Langfuse został już utworzony)"""
+    # _langfuse to wewnętrzne pole OpenAILangfuse z langfuse==2.40.0 (None do pierwszego zapytania);
+    # publiczne flush_langfuse() nie sprawdza go i rzuca AttributeError — przy zmianie wersji sprawdzić
+    if langfuse_modifier._langfuse is not None:
+        langfuse_modifier.flush()
+
+@st.cache_resource(show_spinner=False)
+def register_langfuse_flush_on_exit() -> None:
+    """Rejestruje (raz na proces) opróżnienie kolejki Langfuse przy zamykaniu aplikacji.
+    Trace'y wysyła w tle wątek Langfuse — w ścieżce czatu nie wywołujemy flush, żeby nie blokować odpowiedzi.
+    Wywoływane dopiero po pierwszym zapytaniu: Langfuse rejestruje wtedy atexit(join) swoich wątków,
+    a nasz handler (zarejestrowany później) wykona się przed nim — atexit działa w kolejności LIFO.
+    """
+    atexit.register(flush_langfuse_on_exit)
+
+@st.cache_resource(show_spinner=False, max_entries=8, ttl=3600)
+def get_openai_client(api_key: str) -> OpenAI:
+    """Zwraca klienta OpenAI (z Langfuse) współdzielonego między przebiegami — zachowuje pulę połączeń keep-alive.
+    Klucz jest w kluczu cache, więc max_entries/ttl ograniczają liczbę klientów (i kluczy) trzymanych w pamięci.
+    """
+    return OpenAI(api_key=api_key)
+
+def load_token_encoding(model: str) -> tiktoken.Encoding:
+    """Wczytuje tokenizer dla modelu (o200k_base, jeśli tiktoken nie zna jeszcze tego modelu).
+    Przy pierwszym użyciu tiktoken pobiera pliki kodowania z sieci (bez limitu czasu).
+    """
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+@st.cache_resource(show_spinner=False)
+def start_token_encoding_load(model: str) -> Future:
+    """Uruchamia wczytanie tokenizera w wątku w tle (raz na model) — pobieranie nie blokuje przebiegu aplikacji"""
+    executor = ThreadPoolExecutor(max_workers=1)
+    future = executor.submit(load_token_encoding, model)
+    executor.shutdown(wait=False)
+    return future
+
+def get_token_encoding(model: str) -> Optional[tiktoken.Encoding]:
+    """Zwraca tokenizer, jeśli jest już wczytany; None, gdy wciąż się wczytuje albo wczytanie się nie powiodło.
+    Nieudanego wczytania nie trzymamy w cache — kolejne wywołanie uruchamia nową próbę.
+    """
+    future = start_token_encoding_load(model)
+    if not future.done():
+        return None
+    if future.exception() is not None:
+        start_token_encoding_load.clear()
+        return None
+    return future.result()
+
+def count_message_tokens(message: Dict, model: str) -> int:
+    """Zwraca liczbę tokenów treści wiadomości; wynik zapisywany jest w wiadomości (content_tokens), więc liczymy raz"""
+    if "content_tokens" not in message:
+        encoding = get_token_encoding(model)
+        if encoding is None:
+            # Tokenizer niedostępny — szacunek (~4 znaki na token), którego nie zapisujemy w wiadomości
+            return len(message["content"]) // 4
+        message["content_tokens"] = len(encoding.encode(message["content"], disallowed_special=()))
+    return message["content_tokens"]
+
+def fit_memory_to_budget(messages: List[Dict], model: str, budget: int = MEMORY_TOKEN_BUDGET) -> List[Dict]:
+    """Zwraca najnowsze wiadomości, które mieszczą się w budżecie tokenów (od najstarszej do najnowszej)"""
+    kept = []
+    total = 0
+    for message in reversed(messages):
+        tokens = count_message_tokens(message, model)
+        if total + tokens > budget:
+            break
+        kept.append(message)
+        total += tokens
+    return list(reversed(kept))
+
 def chatbot_reply(user_prompt: str, memory: List[Dict], file_content: Optional[str] = None) -> Dict:
-    """Generuje odpowiedź chatbota"""
+    """Generuje odpowiedź chatbota i wyświetla ją strumieniowo (token po tokenie)"""
     if st.session_state.get("demo_mode") or not st.session_state.get("openai_client"):
+        content = (
+            "**Tryb demo** — generowanie odpowiedzi wymaga klucza API OpenAI. "
+            "Uruchom ponownie aplikację i wybierz „Uruchom z kluczem”, aby korzystać z czatu."
+        )
+        st.markdown(content)
         return {
             "role": "assistant",
-            "content": (
-                "**Tryb demo** — generowanie odpowiedzi wymaga klucza API OpenAI. "
-                "Uruchom ponownie aplikację i wybierz „Uruchom z kluczem”, aby korzystać z czatu."
-            ),
+            "content": content,
             "usage": {},
         }
 
     # Przygotowanie wiadomości systemowej
     system_content = st.session_state.get("chatbot_personality", DEFAULT_PERSONALITY)
     
-    # Jeśli jest plik, dodaj jego treść do systemu
+    # Jeśli jest plik, dodaj jego treść do systemu (przycięta do MAX_FILE_CONTENT_CHARS).
+    # Dokument jest zawsze w wiadomości systemowej na początku promptu — stały prefiks między turami
+    # pozwala OpenAI korzystać z automatycznego cache'owania promptu.
     if file_content:
-        system_content += f"\n\nOtrzymałeś również następujący dokument do analizy:\n\n{file_content}"
+        system_content += f"\n\nOtrzymałeś również następujący dokument do analizy:\n\n{file_content[:MAX_FILE_CONTENT_CHARS]}"
     
     messages = [{"role": "system", "content": system_content}]
     
@@ -341,35 +534,68 @@ def chatbot_reply(user_prompt: str, memory: List[Dict], file_content: Optional[s
     messages.append({"role": "user", "content": user_prompt})
     
     try:
-        import time
         start_time = time.time()
+
+        # Treść zbieramy niezależnie od st.write_stream — fragmenty bez delta.content
+        # (np. tool_calls albo końcowy fragment z usage) nie przerywają odbioru
+        content_parts = []
+        finish_reason = None
+        stream_usage = None
+        first_token_time = None
+
+        def content_deltas(stream):
+            nonlocal finish_reason, stream_usage, first_token_time
+            for chunk in stream:
+                if chunk.usage:
+                    stream_usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.finish_reason:
+                    finish_reason = choice.finish_reason
+                delta = choice.delta.content if choice.delta else None
+                if delta:
+                    if first_token_time is None:
+                        first_token_time = time.time()
+                    content_parts.append(delta)
+                    yield delta
+
+        # Spinner trwa do pierwszego fragmentu treści — modele rozumujące długo milczą przed odpowiedzią
         with st.spinner("🤖 Generuję odpowiedź..."):
-            response = st.session_state.openai_client.chat.completions.create(
+            stream = st.session_state.openai_client.chat.completions.create(
                 model=st.session_state.selected_model,
                 messages=messages,
                 temperature=1,
-                max_completion_tokens=5000
+                max_completion_tokens=5000,
+                stream=True,
+                stream_options={"include_usage": True},  # ostatni fragment strumienia zawiera zużycie tokenów
             )
+            register_langfuse_flush_on_exit()
+            deltas = content_deltas(stream)
+            first_delta = next(deltas, None)
+
+        if first_delta is not None:
+            st.write_stream(itertools.chain([first_delta], deltas))
         elapsed = time.time() - start_time
+        content = "".join(content_parts)
+
         # Sprawdzenie użycia tokenów
         usage = {}
-        if response.usage:
+        if stream_usage:
             usage = {
-                "prompt_tokens": response.usage.prompt_tokens,
-                "completion_tokens": response.usage.completion_tokens,
-                "total_tokens": response.usage.total_tokens,
+                "prompt_tokens": stream_usage.prompt_tokens,
+                "completion_tokens": stream_usage.completion_tokens,
+                "total_tokens": stream_usage.total_tokens,
                 "response_time": elapsed,  # Dodaj czas odpowiedzi w sekundach
+                "completion_start_time": first_token_time,  # Moment otrzymania pierwszego tokenu (unix time)
             }
-        
-        # Sprawdź czy odpowiedź została obcięta z powodu limitu tokenów
-        choice = response.choices[0]
-        finish_reason = choice.finish_reason
-        content = choice.message.content or ""
-        
+
         # Jeśli odpowiedź została obcięta (finish_reason == "length"), dodaj informację
         if finish_reason == "length":
-            content += "\n\n⚠️ **Odpowiedź została obcięta** - osiągnięto limit tokenów. Zwiększ `max_completion_tokens` aby uzyskać pełną odpowiedź."
-        
+            truncation_note = "\n\n⚠️ **Odpowiedź została obcięta** - osiągnięto limit tokenów. Zwiększ `max_completion_tokens` aby uzyskać pełną odpowiedź."
+            st.markdown(truncation_note)
+            content += truncation_note
+
         return {
             "role": "assistant",
             "content": content,
@@ -380,9 +606,11 @@ def chatbot_reply(user_prompt: str, memory: List[Dict], file_content: Optional[s
         error_message = f"❌ Błąd API OpenAI: {str(e)}"
         st.session_state.error_message = error_message
         st.error(error_message)
+        content = f"Przepraszam, wystąpił błąd podczas generowania odpowiedzi.\n\n**Szczegóły błędu:**\n{str(e)}\n\nSpróbuj ponownie lub sprawdź ustawienia."
+        st.markdown(content)
         return {
             "role": "assistant",
-            "content": f"Przepraszam, wystąpił błąd podczas generowania odpowiedzi.\n\n**Szczegóły błędu:**\n{str(e)}\n\nSpróbuj ponownie lub sprawdź ustawienia.",
+            "content": content,
             "usage": {},
         }
 
@@ -390,17 +618,110 @@ def chatbot_reply(user_prompt: str, memory: List[Dict], file_content: Optional[s
 # DATABASE FUNCTIONS
 # ==============================================================================
 
+def read_json(path: Path):
+    """Wczytuje plik JSON (orjson — szybsze dekodowanie niż stdlib json)"""
+    return orjson.loads(path.read_bytes())
+
+def atomic_write_bytes(path: Path, data: bytes):
+    """Zapisuje plik atomowo: jeden zapis do pliku tymczasowego w tym samym katalogu, potem os.replace.
+    Przerwany zapis nie zostawia uszkodzonego pliku docelowego.
+    """
+    # Unikalna nazwa pliku tymczasowego — równoległe sesje zapisujące ten sam plik nie nadpisują sobie tmp
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+def write_json(path: Path, data):
+    """Zapisuje dane jako JSON w UTF-8 z wcięciem 2 spacji (orjson, zapis atomowy)"""
+    atomic_write_bytes(path, orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+
 def ensure_db_structure():
     """Zapewnia istnienie struktury bazy danych"""
     if not DB_PATH.exists():
         DB_PATH.mkdir(exist_ok=True)
         DB_CONVERSATIONS_PATH.mkdir(exist_ok=True)
 
+def conversation_index_entry(conversation: Dict) -> Dict:
+    """Zwraca wpis indeksu (metadane bez treści wiadomości) dla konwersacji"""
+    return {
+        "id": conversation["id"],
+        "name": conversation["name"],
+        "message_count": len(conversation.get("messages", [])),
+    }
+
+@st.cache_resource
+def get_conversation_index_lock() -> threading.RLock:
+    """Blokada indeksu konwersacji — odczyt-modyfikacja-zapis indeksu nie może przeplatać się między sesjami.
+    RLock, bo load_conversation_index może odbudować indeks wewnątrz aktualizacji.
+    """
+    return threading.RLock()
+
+def save_conversation_index(index: Dict[str, Dict]):
+    """Zapisuje indeks konwersacji"""
+    write_json(DB_INDEX_PATH, index)
+
+def rebuild_conversation_index() -> Dict[str, Dict]:
+    """Odbudowuje indeks z plików konwersacji (jednorazowo, gdy indeksu brak lub jest uszkodzony).
+    Nazwy pochodzą z transkryptów, więc zmiany nazw zapisane od tamtej pory tylko w indeksie przepadają —
+    dlatego czytelnego indeksu nigdy nie odbudowujemy.
+    """
+    index = {}
+    for file_path in DB_CONVERSATIONS_PATH.glob("*.json"):
+        try:
+            conversation = read_json(file_path)
+            index[str(conversation["id"])] = conversation_index_entry(conversation)
+        except (orjson.JSONDecodeError, KeyError):
+            continue
+
+    save_conversation_index(index)
+    return index
+
+def load_conversation_index() -> Dict[str, Dict]:
+    """Wczytuje indeks konwersacji; odbudowuje go, jeśli nie istnieje"""
+    with get_conversation_index_lock():
+        if DB_INDEX_PATH.exists():
+            try:
+                return read_json(DB_INDEX_PATH)
+            except orjson.JSONDecodeError:
+                pass
+        return rebuild_conversation_index()
+
+def update_conversation_index(conversation: Dict):
+    """Aktualizuje wpis konwersacji w indeksie (wywoływane przy każdym zapisie konwersacji)"""
+    with get_conversation_index_lock():
+        index = load_conversation_index()
+        index[str(conversation["id"])] = conversation_index_entry(conversation)
+        save_conversation_index(index)
+
+def update_conversation_name(conversation_id: int, name: str, message_count: int):
+    """Zmienia nazwę konwersacji tylko w indeksie — bez przepisywania całego transkryptu.
+    Brakujący wpis (np. konwersacja jeszcze niezapisana) jest dodawany, żeby zmiana nazwy nie przepadła.
+    """
+    with get_conversation_index_lock():
+        index = load_conversation_index()
+        entry = index.setdefault(str(conversation_id), {"id": conversation_id, "message_count": message_count})
+        entry["name"] = name
+        save_conversation_index(index)
+
+def remove_from_conversation_index(conversation_id: int):
+    """Usuwa wpis konwersacji z indeksu"""
+    with get_conversation_index_lock():
+        index = load_conversation_index()
+        if index.pop(str(conversation_id), None) is not None:
+            save_conversation_index(index)
+
 def load_conversation_to_state(conversation: Dict):
     """Ładuje konwersację do stanu sesji"""
+    # Nazwa z indeksu ma pierwszeństwo — zmiana nazwy nie przepisuje transkryptu
+    index_entry = load_conversation_index().get(str(conversation["id"]))
     st.session_state.update({
         "conversation_id": conversation["id"],
-        "conversation_name": conversation["name"],
+        "conversation_name": index_entry["name"] if index_entry else conversation["name"],
         "messages": conversation["messages"],
         "chatbot_personality": conversation["chatbot_personality"]
     })
@@ -421,24 +742,20 @@ def load_current_conversation():
         }
         
         # Zapisz konwersację
-        with open(DB_CONVERSATIONS_PATH / "1.json", "w", encoding="utf-8") as f:
-            json.dump(conversation, f, ensure_ascii=False, indent=2)
+        write_json(DB_CONVERSATIONS_PATH / "1.json", conversation)
+        update_conversation_index(conversation)
         
         # Zapisz jako aktualną
-        with open(current_file, "w", encoding="utf-8") as f:
-            json.dump({"current_conversation_id": 1}, f, indent=2)
+        write_json(current_file, {"current_conversation_id": 1})
     
     else:
         # Wczytaj ID aktualnej konwersacji
-        with open(current_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            conversation_id = data["current_conversation_id"]
+        conversation_id = read_json(current_file)["current_conversation_id"]
         
         # Wczytaj konwersację
         conversation_file = DB_CONVERSATIONS_PATH / f"{conversation_id}.json"
         if conversation_file.exists():
-            with open(conversation_file, "r", encoding="utf-8") as f:
-                conversation = json.load(f)
+            conversation = read_json(conversation_file)
         else:
             # Jeśli plik nie istnieje, stwórz nową konwersację
             conversation = {
@@ -460,8 +777,8 @@ def save_conversation():
         "messages": st.session_state.get("messages", []),
     }
     
-    with open(DB_CONVERSATIONS_PATH / f"{conversation_id}.json", "w", encoding="utf-8") as f:
-        json.dump(conversation, f, ensure_ascii=False, indent=2)
+    write_json(DB_CONVERSATIONS_PATH / f"{conversation_id}.json", conversation)
+    update_conversation_index(conversation)
 
 def create_new_conversation():
     """Tworzy nową konwersację"""
@@ -486,12 +803,11 @@ def create_new_conversation():
     }
     
     # Zapisz nową konwersację
-    with open(DB_CONVERSATIONS_PATH / f"{new_id}.json", "w", encoding="utf-8") as f:
-        json.dump(conversation, f, ensure_ascii=False, indent=2)
+    write_json(DB_CONVERSATIONS_PATH / f"{new_id}.json", conversation)
+    update_conversation_index(conversation)
     
     # Ustaw jako aktualną
-    with open(DB_PATH / "current.json", "w", encoding="utf-8") as f:
-        json.dump({"current_conversation_id": new_id}, f, indent=2)
+    write_json(DB_PATH / "current.json", {"current_conversation_id": new_id})
     
     load_conversation_to_state(conversation)
     st.session_state["chatbot_personality"] = DEFAULT_PERSONALITY  # Ustaw w session_state
@@ -502,32 +818,17 @@ def switch_conversation(conversation_id: int):
     conversation_file = DB_CONVERSATIONS_PATH / f"{conversation_id}.json"
     
     if conversation_file.exists():
-        with open(conversation_file, "r", encoding="utf-8") as f:
-            conversation = json.load(f)
+        conversation = read_json(conversation_file)
         
         # Ustaw jako aktualną
-        with open(DB_PATH / "current.json", "w", encoding="utf-8") as f:
-            json.dump({"current_conversation_id": conversation_id}, f, indent=2)
+        write_json(DB_PATH / "current.json", {"current_conversation_id": conversation_id})
         
         load_conversation_to_state(conversation)
         st.rerun()
 
 def list_conversations() -> List[Dict]:
-    """Zwraca listę wszystkich konwersacji"""
-    conversations = []
-    
-    for file_path in DB_CONVERSATIONS_PATH.glob("*.json"):
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                conversation = json.load(f)
-                conversations.append({
-                    "id": conversation["id"],
-                    "name": conversation["name"],
-                    "message_count": len(conversation.get("messages", [])),
-                })
-        except (json.JSONDecodeError, KeyError):
-            continue
-    
+    """Zwraca listę wszystkich konwersacji (z indeksu — bez otwierania plików transkryptów)"""
+    conversations = list(load_conversation_index().values())
     return sorted(conversations, key=lambda x: x["id"], reverse=True)
 
 def delete_conversation(conversation_id: int):
@@ -536,6 +837,7 @@ def delete_conversation(conversation_id: int):
     if conversation_file.exists():
         conversation_file.unlink()
         st.success(f"✅ Usunięto konwersację {conversation_id}")
+    remove_from_conversation_index(conversation_id)
 
     # Jeśli usunięto aktualną konwersację, przełącz na inną lub utwórz nową
     if conversation_id == st.session_state.get("conversation_id"):
@@ -558,6 +860,73 @@ def exit_demo_to_configure_key() -> None:
     st.rerun()
 
 
+def format_usage_caption(usage: Dict) -> str:
+    """Zwraca podpis ze statystykami tokenów i czasu dla wiadomości asystenta"""
+    return (
+        f"Tokeny: {usage.get('total_tokens', 0)} | "
+        f"Input: {usage.get('prompt_tokens', 0)} | "
+        f"Output: {usage.get('completion_tokens', 0)} | "
+        f"Czas odpowiedzi: {usage.get('response_time', 0):.2f}s"
+    )
+
+
+def render_chat_message(message: Dict):
+    """Renderuje pojedynczą wiadomość czatu wraz ze statystykami odpowiedzi asystenta"""
+    with st.chat_message(message["role"]):
+        st.markdown(message["content"])
+        
+        # Pokaż statystyki dla wiadomości asystenta
+        if message["role"] == "assistant" and "usage" in message:
+            usage = message["usage"]
+            if usage:
+                st.caption(format_usage_caption(usage))
+
+
+def render_file_processing_progress():
+    """Pokazuje postęp przetwarzania załącznika w tle; po zakończeniu odświeża aplikację z wynikiem"""
+    job = st.session_state.get("file_job")
+    if not job or job["future"].done():
+        st.rerun()
+
+    progress = job["progress"]
+    if progress["total"]:
+        st.progress(
+            progress["done"] / progress["total"],
+            text=f"📄 {job['name']}: {progress['done']}/{progress['total']} stron",
+        )
+    else:
+        st.caption(f"📄 Przetwarzanie pliku {job['name']}...")
+
+
+def render_file_processing_status():
+    """Renderuje stan przesłanego załącznika: postęp (odpytywany co 0,5 s), błąd albo podgląd treści"""
+    job = st.session_state.get("file_job")
+    if not job:
+        return
+
+    collect_file_processing_result()
+    if not job["collected"]:
+        # Fragment odświeża się sam tylko, dopóki plik jest przetwarzany
+        st.fragment(run_every=0.5)(render_file_processing_progress)()
+        return
+
+    if job["error"]:
+        st.error(f"❌ Błąd odczytu pliku {job['extension'].upper()}: {job['error']}")
+        return
+
+    file_content = st.session_state.get("uploaded_file_content")
+    if not file_content:
+        return
+    st.success(f"✅ {job['name']}")
+    if len(file_content) > MAX_FILE_CONTENT_CHARS:
+        st.warning(
+            f"⚠️ Dokument ma {len(file_content):,} znaków — do modelu trafi tylko "
+            f"pierwsze {MAX_FILE_CONTENT_CHARS:,} znaków."
+        )
+    with st.expander("📄 Podgląd"):
+        st.text_area("", file_content[:500] + "..." if len(file_content) > 500 else file_content, height=100, key="preview")
+
+
 def render_sidebar():
     """Renderuje sidebar z ustawieniami"""
     with st.sidebar:
@@ -630,72 +999,80 @@ def render_sidebar():
         messages = st.session_state.get("messages", [])
         total_cost, total_time = calculate_conversation_cost(messages, pricing)
         
-        st.markdown("### 💳 Koszt konwersacji")
-        col1, col2 = st.columns(2)
-        with col1:
-            st.markdown(
-                f"<span style='font-size: 0.8em;'>Koszt w USD</span><br><span style='font-size: 1.5em; font-weight: bold;'>{total_cost:.4f}</span>",
-                unsafe_allow_html=True,
-            )
-        with col2:
-            st.markdown(
-                f"<span style='font-size: 0.8em;'>Koszt w PLN</span><br><span style='font-size: 1.5em; font-weight: bold;'>{total_cost * usd_to_pln:.2f}</span>",
-                unsafe_allow_html=True,
-            )
+        # Cały panel kosztów jako jeden element (jedna wiadomość do przeglądarki zamiast kilku)
+        stats_html = (
+            "<div style='display: grid; grid-template-columns: 1fr 1fr; gap: 0.25rem 1rem;'>"
+            f"<div><span style='font-size: 0.8em;'>Koszt w USD</span><br><span style='font-size: 1.5em; font-weight: bold;'>{total_cost:.4f}</span></div>"
+            f"<div><span style='font-size: 0.8em;'>Koszt w PLN</span><br><span style='font-size: 1.5em; font-weight: bold;'>{total_cost * usd_to_pln:.2f}</span></div>"
+        )
         # Statystyki tokenów i czasu
         if messages:
-            total_tokens = sum(msg.get("usage", {}).get("total_tokens", 0) for msg in messages)
-            st.markdown(f"**Tokeny razem:** {total_tokens:,}")
-            st.markdown(f"**Czas odpowiedzi razem:** {total_time:.2f} s")
+            total_tokens = get_conversation_usage_totals(messages)["total_tokens"]
+            stats_html += (
+                f"<div style='grid-column: 1 / -1;'><b>Tokeny razem:</b> {total_tokens:,}</div>"
+                f"<div style='grid-column: 1 / -1;'><b>Czas odpowiedzi razem:</b> {total_time:.2f} s</div>"
+            )
+        stats_html += "</div>"
+        st.markdown(f"### 💳 Koszt konwersacji\n\n{stats_html}", unsafe_allow_html=True)
 
+@st.fragment
 def render_conversation_manager():
-    """Renderuje zarządzanie konwersacjami"""
-    with st.sidebar:
-        st.markdown("---")
-        st.markdown("## 💬 Konwersacje")
-        
-        # Nazwa aktualnej konwersacji
-        new_name = st.text_input(
-            "📝 Nazwa konwersacji",
-            value=st.session_state.get("conversation_name", ""),
-            key="name_input"
+    """Renderuje zarządzanie konwersacjami (fragment — wywoływany w kontekście st.sidebar).
+    Zmiana nazwy przebudowuje tylko ten fragment; przełączenie/utworzenie/usunięcie konwersacji
+    wywołuje st.rerun() całej aplikacji, bo zmienia też główny czat i koszty w panelu bocznym.
+    """
+    st.markdown("---")
+    st.markdown("## 💬 Konwersacje")
+    
+    # Nazwa aktualnej konwersacji
+    new_name = st.text_input(
+        "📝 Nazwa konwersacji",
+        value=st.session_state.get("conversation_name", ""),
+        key="name_input"
+    )
+    
+    if new_name != st.session_state.get("conversation_name"):
+        st.session_state.conversation_name = new_name
+        update_conversation_name(
+            st.session_state.get("conversation_id", 1),
+            new_name,
+            len(st.session_state.get("messages", [])),
         )
-        
-        if new_name != st.session_state.get("conversation_name"):
-            st.session_state.conversation_name = new_name
-            save_conversation()
-        
-        # Przycisk nowej konwersacji
-        if st.button("➕ Nowa konwersacja", use_container_width=True):
-            create_new_conversation()
-        
-        # Przycisk usuwania aktualnej konwersacji
-        current_id = st.session_state.get("conversation_id", 1)
-        if st.button("🗑️ Usuń aktualną konwersację", use_container_width=True):
-            delete_conversation(current_id)
-        
-        # Lista konwersacji jako selectbox
-        conversations = list_conversations()
-        st.markdown("### 📋 Historia konwersacji")
-
-        # Przygotuj listę nazw do selectboxa
-        conversation_names = [f"{conv['name']} (id: {conv['id']}, msg: {conv['message_count']})" for conv in conversations[:10]]
-        conversation_ids = [conv['id'] for conv in conversations[:10]]
-
-        if conversation_names:
-            selected_idx = conversation_ids.index(current_id) if current_id in conversation_ids else 0
-            selected_conv = st.selectbox(
-                "Wybierz konwersację",
-                options=conversation_names,
-                index=selected_idx
-            )
-            # Po wyborze znajdź id i przełącz, jeśli inna niż aktualna
-            selected_id = conversation_ids[conversation_names.index(selected_conv)]
-            if selected_id != current_id:
-                switch_conversation(selected_id)  # Przełącz na wybraną konwersację
-        
+    
+    # Przycisk nowej konwersacji
+    if st.button("➕ Nowa konwersacja", use_container_width=True):
+        create_new_conversation()
+    
+    # Przycisk usuwania aktualnej konwersacji
+    current_id = st.session_state.get("conversation_id", 1)
+    if st.button("🗑️ Usuń aktualną konwersację", use_container_width=True):
+        delete_conversation(current_id)
+    
+    # Lista konwersacji jako selectbox
+    conversations = list_conversations()
+    st.markdown("### 📋 Historia konwersacji")
+
+    # Przygotuj listę nazw do selectboxa
+    conversation_names = [f"{conv['name']} (id: {conv['id']}, msg: {conv['message_count']})" for conv in conversations[:10]]
+    conversation_ids = [conv['id'] for conv in conversations[:10]]
+
+    if conversation_names:
+        selected_idx = conversation_ids.index(current_id) if current_id in conversation_ids else 0
+        selected_conv = st.selectbox(
+            "Wybierz konwersację",
+            options=conversation_names,
+            index=selected_idx
+        )
+        # Po wyborze znajdź id i przełącz, jeśli inna niż aktualna
+        selected_id = conversation_ids[conversation_names.index(selected_conv)]
+        if selected_id != current_id:
+            switch_conversation(selected_id)  # Przełącz na wybraną konwersację
+
+@st.fragment
 def render_main_chat():
-    """Renderuje główny interfejs czatu"""
+    """Renderuje główny interfejs czatu (fragment — np. przesłanie pliku przebudowuje tylko czat).
+    Po odpowiedzi modelu wywoływane jest st.rerun() całej aplikacji, żeby odświeżyć koszty w panelu bocznym.
+    """
     # Wyświetl błąd jeśli istnieje
     if "error_message" in st.session_state:
         st.error(st.session_state.error_message)
@@ -734,20 +1111,18 @@ def render_main_chat():
     # Wyświetl historię konwersacji
     messages = st.session_state.get("messages", [])
     
-    for message in messages:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
-            
-            # Pokaż statystyki dla wiadomości asystenta
-            if message["role"] == "assistant" and "usage" in message:
-                usage = message["usage"]
-                if usage:
-                    st.caption(
-                        f"Tokeny: {usage.get('total_tokens', 0)} | "
-                        f"Input: {usage.get('prompt_tokens', 0)} | "
-                        f"Output: {usage.get('completion_tokens', 0)} | "
-                        f"Czas odpowiedzi: {usage.get('response_time', 0):.2f}s"
-                    )
+    # Renderujemy tylko ostatnie VISIBLE_MESSAGES wiadomości — starsze dopiero po włączeniu przełącznika,
+    # więc koszt przebiegu nie rośnie z długością całej konwersacji
+    older_messages = messages[:-VISIBLE_MESSAGES]
+    if older_messages and st.toggle(
+        f"Pokaż wcześniejsze wiadomości ({len(older_messages)})",
+        key="show_older_messages",
+    ):
+        for message in older_messages:
+            render_chat_message(message)
+
+    for message in messages[-VISIBLE_MESSAGES:]:
+        render_chat_message(message)
     
     # Kontener dla dolnego paska - zostanie na miejscu podczas przewijania
     bottom_container = st.container()
@@ -759,19 +1134,14 @@ def render_main_chat():
             # Upload pliku
             uploaded_file = st.file_uploader(
                 "📁 Załącznik",
-                type=["txt", "pdf", "docx"],
+                type=list(FILE_EXTRACTORS),
                 help="Prześlij dokument do analizy",
                 key="file_uploader"
             )
             
-            # Przetwórz plik jeśli został przesłany
-            if uploaded_file:
-                file_content = process_uploaded_file(uploaded_file)
-                if file_content:
-                    st.session_state.uploaded_file_content = file_content
-                    st.success(f"✅ {uploaded_file.name}")
-                    with st.expander("📄 Podgląd"):
-                        st.text_area("", file_content[:500] + "..." if len(file_content) > 500 else file_content, height=100, key="preview")
+            # Przetwórz plik w tle, jeśli został przesłany — można w tym czasie pisać pytanie
+            process_uploaded_file(uploaded_file)
+            file_status_container = st.container()
         
         with col2:
             # Input dla nowej wiadomości
@@ -780,6 +1150,15 @@ def render_main_chat():
                 "Tryb demo — czat wyłączony" if demo else "Zadaj pytanie...",
                 disabled=demo,
             )
+
+    # Pytanie wysłane przed końcem przetwarzania załącznika — czekamy na tekst dokumentu
+    if user_input and st.session_state.get("file_job") and not st.session_state.file_job["collected"]:
+        with st.spinner(f"📄 Kończę przetwarzanie pliku {st.session_state.file_job['name']}..."):
+            collect_file_processing_result(wait=True)
+
+    if uploaded_file:
+        with file_status_container:
+            render_file_processing_status()
     
     if user_input:
         # Dodaj wiadomość użytkownika
@@ -788,24 +1167,18 @@ def render_main_chat():
         
         messages.append({"role": "user", "content": user_input})
         
-        # Generuj odpowiedź
+        # Generuj odpowiedź (chatbot_reply sam wyświetla treść strumieniowo)
         with st.chat_message("assistant"):
+            # Historia bez bieżącego pytania (chatbot_reply dodaje je sam), przycięta do budżetu tokenów
             response = chatbot_reply(
-                user_input, 
-                memory=messages[-20:],  # Ostatnie 20 wiadomości jako kontekst
+                user_input,
+                memory=fit_memory_to_budget(messages[:-1], st.session_state.selected_model),
                 file_content=st.session_state.get("uploaded_file_content", None)
             )
-            st.markdown(response["content"])
-            
+
             # Pokaż statystyki
             if response["usage"]:
-                usage = response["usage"]
-                st.caption(
-                    f"Tokeny: {usage.get('total_tokens', 0)} | "
-                    f"Input: {usage.get('prompt_tokens', 0)} | "
-                    f"Output: {usage.get('completion_tokens', 0)} | "
-                    f"Czas odpowiedzi: {usage.get('response_time', 0):.2f}s"
-                )
+                st.caption(format_usage_caption(response["usage"]))
         
         # Dodaj odpowiedź do historii
         messages.append(response)
@@ -819,6 +1192,15 @@ def render_main_chat():
 # MAIN APPLICATION
 # ==============================================================================
 
+@st.cache_resource
+def load_app_css() -> str:
+    """Wczytuje arkusz stylów aplikacji (cache na cały proces — bez czytania pliku przy każdym przebiegu).
+    Pusty napis, gdy pliku brak — aplikacja działa wtedy bez własnych stylów.
+    """
+    if not APP_CSS_PATH.exists():
+        return ""
+    return APP_CSS_PATH.read_text(encoding="utf-8")
+
 def main():
     """Główna funkcja aplikacji"""
     # Konfiguracja strony
@@ -835,27 +1217,10 @@ def main():
     
     )
 
-    HIDE_STREAMLIT_STYLE = """
-        <style>
-        /* Menu ⋮, stopka, toolbar — bez ukrywania całego header:
-           w nagłówku jest przycisk rozwijania/zwijania sidebara; display:none na header
-           sprawiał, że po zwinięciu panelu nie dało się go przywrócić. */
-        #MainMenu {visibility: hidden;}
-        footer {visibility: hidden;}
-        [data-testid="stToolbar"] {visibility: hidden; height: 0; position: fixed;}
-        /* Nie ukrywaj stBaseButton-header — to często przycisk „Open sidebar” po zwinięciu */
-        .stDeployButton, [data-testid="stDecoration"] {display: none !important;}
-
-        /* PRAWY DOLNY RÓG — Manage app (Cloud) */
-        button[aria-label="Manage app"] {display: none !important;}
-        a[aria-label="Manage app"] {display: none !important;}
-        [data-testid="manageAppButton"] {display: none !important;}
-        [data-testid="stCloudManageApp"] {display: none !important;}
-        /* Fallback (gdyby a11y/aria się zmieniło) */
-        div[role="complementary"] [title="Manage app"] {display: none !important;}
-        </style>
-    """
-    st.markdown(HIDE_STREAMLIT_STYLE, unsafe_allow_html=True)
+    # Style CSS aplikacji (plik wczytywany raz na proces)
+    app_css = load_app_css()
+    if app_css:
+        st.markdown(f"<style>{app_css}</style>", unsafe_allow_html=True)
 
     # Pobierz aktualny kurs USD/PLN (z cache) i zapisz datę kursu
     rate, rate_date = get_usd_to_pln_rate()
@@ -863,71 +1228,6 @@ def main():
     USD_TO_PLN = rate
     st.session_state["usd_to_pln_date"] = rate_date
 
-
-    # Dodaj CSS style
-    st.markdown("""
-    <style>
-        .main-header {
-            background: linear-gradient(90deg, #667eea 0%, #764ba2 100%);
-            padding: 1rem;
-            border-radius: 10px;
-            margin-bottom: 2rem;
-        }
-        .stTextInput > div > div > input {
-            background-color: #f0f2f6 !important;
-            color: #262730 !important;
-        }
-        .stTextArea > div > div > textarea {
-            background-color: #f0f2f6 !important;
-            color: #262730 !important;
-            border: 1px solid #d1d5db !important;
-        }
-        .stTextArea textarea {
-            background-color: #f0f2f6 !important;
-            color: #262730 !important;
-        }
-        .chat-message {
-            padding: 1rem;
-            border-radius: 10px;
-            margin: 1rem 0;
-        }
-        /* Pełna szerokość tylko w treści i sidebarze — nie w nagłówku Streamlit (menu panelu) */
-        section[data-testid="stSidebar"] .stButton > button,
-        .main .block-container .stButton > button {
-            width: 100%;
-            border-radius: 5px;
-        }
-        /* Dodatkowe style dla lepszej czytelności */
-        .stTextArea label {
-            color: #262730 !important;
-            font-weight: 600;
-        }
-        .stSelectbox label {
-            color: #262730 !important;
-            font-weight: 600;
-        }
-        .stTextInput label {
-            color: #262730 !important;
-            font-weight: 600;
-        }
-        /* Style dla dolnego paska */
-        .bottom-bar {
-            position: fixed;
-            bottom: 0;
-            left: 0;
-            right: 0;
-            background-color: white;
-            padding: 1rem;
-            border-top: 1px solid #e1e5e9;
-            z-index: 1000;
-        }
-        /* Dodaj miejsce na dole aby chat nie był zakryty */
-        .main .block-container {
-            padding-bottom: 120px !important;
-        }
-    </style>
-    """, unsafe_allow_html=True)
-
     # Inicjalizacja
     env = load_environment()
     validate_openai_credentials(env)
@@ -937,7 +1237,7 @@ def main():
         st.session_state.openai_client = None
     else:
         api_key = get_raw_api_key(env)
-        st.session_state.openai_client = OpenAI(api_key=api_key)
+        st.session_state.openai_client = get_openai_client(api_key)
 
     # Wczytaj konwersację
     if "conversation_id" not in st.session_state:
@@ -945,7 +1245,11 @@ def main():
 
     # Renderuj interfejs
     render_sidebar()
-    render_conversation_manager()
+    # Tokenizer wczytywany w tle od startu — do pierwszego pytania zwykle jest już gotowy
+    start_token_encoding_load(st.session_state.selected_model)
+    # Fragment nie może sam otwierać st.sidebar — wywołujemy go w kontekście panelu bocznego
+    with st.sidebar:
+        render_conversation_manager()
     render_main_chat()
 
 if __name__ == "__main__":